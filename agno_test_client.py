@@ -1,62 +1,82 @@
 import asyncio
+import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from textwrap import dedent
 
 from agno.agent import Agent
 from agno.tools.mcp import MCPTools
-from mcp import StdioServerParameters
 from agno.models.openai import OpenAIChat
 
+# Run on the libuv-based uvloop event loop where available (not on Windows).
+# Only the loop created by asyncio.run() in __main__ uses it; importing this
+# module leaves the global event loop policy alone.
+try:
+    import uvloop
+    _LOOP_FACTORY = uvloop.new_event_loop
+except ImportError:
+    _LOOP_FACTORY = None
+
+# URL of the running MCP server (start it with `uv run chinook_mcp_server.py`)
+MCP_SERVER_URL = os.environ.get("CHINOOK_MCP_URL", "http://127.0.0.1:8000/mcp")
+
+# System instructions for the agent, dedented once at import
+_AGENT_INSTRUCTIONS = dedent("""
+    You are an assistant for querying the Chinook Online Music Store database. Help users explore the database and execute queries.
+""")
+
+# input() blocks, so the REPL reads the console on its own worker thread.
+# It is kept out of the loop's default executor, which asyncio.run() waits
+# for at shutdown even while input() is still blocked.
+_INPUT_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="repl-input")
+
 # --- Main Agent Runner ---
-async def run_agent(message: str) -> None:
+async def run_agent() -> None:
     """
-    Run the Chinook database agent with the given message.
-    This function starts the MCP server (chinook_mcp_server.py) as a subprocess,
-    connects to it using MCPTools, and creates an Agno agent with OpenAIChat as the LLM.
-    The agent is configured to use the MCP server as a tool for answering queries about the Chinook database.
-    Args:
-        message (str): The user query to send to the agent.
+    Run the Chinook database agent in an interactive REPL.
+    This function connects to the already running MCP server (chinook_mcp_server.py)
+    over streamable HTTP using MCPTools, and creates an Agno agent with OpenAIChat as the LLM.
+    The same MCP session and agent then answer every query.
     """
 
-    # Initialize the MCP server parameters for stdio transport.
-    # Uses 'uv' to run the server for fast startup and reloads.
-    server_params = StdioServerParameters(
-        command="uv",
-        args=["run", "chinook_mcp_server.py"]
-    )
-
     # Create a client session to connect to the MCP server as a tool.
-    async with MCPTools(server_params=server_params) as mcp_tools:
+    async with MCPTools(url=MCP_SERVER_URL, transport="streamable-http") as mcp_tools:
         # Set up the Agno agent with the OpenAIChat model and MCP tools.
         agent = Agent(
             model=OpenAIChat(id="gpt-4.1-mini"),
             tools=[mcp_tools],
-            instructions=dedent("""
-                You are an assistant for querying the Chinook Online Music Store database. Help users explore the database and execute queries.
-            """),
+            instructions=_AGENT_INSTRUCTIONS,
             markdown=True,           # Format output as Markdown
             show_tool_calls=True,    # Show tool calls in the output
         )
 
-        # Run the agent and print the response to the user, streaming output as it arrives.
-        try:
-            await agent.aprint_response(message, stream=True)
-        except Exception as e:
-            print(f"Error: {e}")
+        # Simple REPL loop for user queries. Reading the next query happens off
+        # the event loop, so the previous response can finish tearing down
+        # while the user types.
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                query = await loop.run_in_executor(_INPUT_EXECUTOR, input, "> ")
+            except EOFError:  # Ctrl+D or end of piped input
+                print()
+                return
+            if query in {"q", "quit", "exit"}:
+                return
+            # Run the agent and print the response to the user, streaming output as it arrives.
+            try:
+                await agent.aprint_response(query, stream=True)
+            except Exception as e:
+                print(f"Error: {e}")
 
 
 # --- Interactive CLI Loop ---
 if __name__ == "__main__":
     try:
-        # Simple REPL loop for user queries
-        while True:
-            query = input("> ")
-            if query in {"q", "quit", "exit"}:
-                sys.exit(0)  # Clean exit
-            # Run the agent for the user's query (asyncio.run ensures event loop is managed)
-            asyncio.run(
-                run_agent(query)
-            )
+        # One event loop and one MCP session for the whole REPL
+        asyncio.run(run_agent(), loop_factory=_LOOP_FACTORY)
     except KeyboardInterrupt:
-        print("\nExiting.")
-        sys.exit(0)
\ No newline at end of file
+        print("\nExiting.", flush=True)
+        # input() may still be blocked on the worker thread, which a normal
+        # interpreter exit would wait for, so leave immediately.
+        os._exit(0)
+    sys.exit(0)  # Clean exit
@@ -10,74 +10,152 @@ Features:
 - Tool endpoint for executing SELECT queries (read-only).
 - Prompt templates for common LLM tasks (list tables, show schema, count rows, query top artists).
 - Safe SQL identifier escaping for SQLite.
+- Served over streamable HTTP (default, for a long-running local service) or stdio.
 - Designed for use with Agno agents or other MCP-compatible clients.
 """
 
 import sqlite3
+import argparse
 import asyncio
+import shutil
+import urllib.request # For downloading the database
+import csv
+import functools
+import io
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
 from pathlib import Path
-import httpx # For downloading the database
+import aiosqlite # Async wrapper around sqlite3
+from aiosqlitepool import SQLiteConnectionPool # Pools long-lived aiosqlite connections
 import zipfile # For unzipping
 import logging
 from mcp.server.fastmcp import FastMCP, Context
 import mcp.server.fastmcp.prompts.base as mcp_prompts
 
+# Run on the libuv-based uvloop event loop where available (not on Windows).
+# Only the loop created by asyncio.run() in __main__ uses it; importing this
+# module leaves the global event loop policy alone.
+try:
+    import uvloop
+    _LOOP_FACTORY = uvloop.new_event_loop
+except ImportError:
+    _LOOP_FACTORY = None
+
 
 # --- Database Setup ---
 # Path to the local SQLite database file
 DB_FILE = Path("Chinook.db")
 # URL to download the Chinook sample database zip
 DB_URL = "https://www.sqlitetutorial.net/wp-content/uploads/2018/03/chinook.zip"
+# Chunk size used when streaming the download and extracting the database
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+# Seconds to wait on the download host before giving up, so a stalled
+# connection cannot hang server startup
+DOWNLOAD_TIMEOUT = 30
+# Rows fetched per batch when formatting query results; progress is
+# reported to the client after each batch
+QUERY_FETCH_SIZE = 500
+# Prepared statements kept per pooled connection. sqlite3 caches compiled
+# statements keyed by SQL text, so a repeated query (LLMs often re-issue the
+# same COUNT/schema lookups) skips parsing and planning.
+STATEMENT_CACHE_SIZE = 256
+
+# PRAGMAs applied to every pooled connection when it is first opened.
+# The workload is read-only against a small database, so map the whole
+# file into memory and keep a generous page cache on each connection.
+# (Journal mode and sync settings do not apply to a read-only database.)
+_CONNECTION_PRAGMAS = (
+    "PRAGMA mmap_size=268435456;", # 256 MiB
+    "PRAGMA cache_size=-32000;", # ~32 MB
+    "PRAGMA temp_store=MEMORY;",
+    "PRAGMA query_only=ON;", # Rejects any statement that would write to the database
+)
+
+# Authorizer action codes that only read data
+_READ_ONLY_ACTIONS = frozenset({
+    sqlite3.SQLITE_SELECT,
+    sqlite3.SQLITE_READ,
+    sqlite3.SQLITE_FUNCTION,
+    sqlite3.SQLITE_RECURSIVE, # WITH RECURSIVE ... SELECT
+})
+# PRAGMAs that only report on the schema
+_READ_ONLY_PRAGMAS = frozenset({"table_info"})
+
+def _read_only_authorizer(action: int, arg1: str | None, arg2: str | None, db_name: str | None, trigger_name: str | None) -> int:
+    """
+    SQLite authorizer callback that denies every operation except reads.
+    Runs inside SQLite while each statement is prepared, so writes, DDL,
+    ATTACH and PRAGMA changes are rejected before they execute.
+    """
+    if action in _READ_ONLY_ACTIONS:
+        return sqlite3.SQLITE_OK
+    if action == sqlite3.SQLITE_PRAGMA and arg1 in _READ_ONLY_PRAGMAS:
+        return sqlite3.SQLITE_OK
+    return sqlite3.SQLITE_DENY
 
-def get_db_connection():
+async def _create_db_connection() -> aiosqlite.Connection:
     """
-    Helper to get a SQLite connection with row factory set for dict-like access.
+    Connection factory for the pool: opens an aiosqlite connection with the
+    row factory set for dict-like access, the connection PRAGMAs applied
+    and the read-only authorizer installed.
     """
-    conn = sqlite3.connect(DB_FILE)
+    # The database is never written at runtime, so open it read-only and
+    # immutable: SQLite then skips file locking and -wal/-shm checks entirely
+    db_uri = f"{DB_FILE.resolve().as_uri()}?mode=ro&immutable=1"
+    conn = await aiosqlite.connect(db_uri, uri=True, cached_statements=STATEMENT_CACHE_SIZE)
     conn.row_factory = sqlite3.Row
+    for pragma in _CONNECTION_PRAGMAS:
+        await conn.execute(pragma)
+    # SQLite reports the one-time creation of the pragma_table_info virtual
+    # table as an UPDATE of sqlite_master, so create it before the authorizer.
+    await conn.execute("SELECT name FROM pragma_table_info('sqlite_master');")
+    await conn.set_authorizer(_read_only_authorizer)
     return conn
 
-async def download_chinook_db():
+# Long-lived pool of connections, reused across resource/tool calls so the
+# SQLite page cache stays warm and queries never block the event loop.
+# Connections are only opened on first use, after the database is downloaded.
+pool = SQLiteConnectionPool(_create_db_connection)
+
+def download_chinook_db():
     """
     Download and extract the Chinook SQLite database if not already present.
+    Runs once, on a worker thread, before the MCP server starts serving.
     """
     if DB_FILE.exists():
         logging.info(f"{DB_FILE} already exists. Skipping download.")
         return
 
     logging.info(f"Downloading Chinook database from {DB_URL}...")
-    async with httpx.AsyncClient(follow_redirects=True) as client:
-        response = await client.get(DB_URL)
-        response.raise_for_status() 
-        
-        zip_path = Path("chinook.zip")
-        with open(zip_path, "wb") as f:
-            f.write(response.content)
-        
-        logging.info(f"Downloaded chinook.zip. Extracting...")
-        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-            db_file_name = None
-            # Find the .db file in the zip archive
-            for member in zip_ref.namelist():
-                if member.endswith(".db"):
-                    db_file_name = member
-                    break
-            if db_file_name:
-                zip_ref.extract(db_file_name, path=".")
-                extracted_db_path = Path(db_file_name)
-                # Handle cases where the db file might be in a subdirectory within the zip
-                if extracted_db_path.name != DB_FILE.name:
-                    target_path = DB_FILE.parent / extracted_db_path.name
-                    if target_path.exists() and target_path.is_dir():
-                         (target_path / DB_FILE.name).rename(DB_FILE)
-                         target_path.rmdir()
-                    elif extracted_db_path.exists():
-                        extracted_db_path.rename(DB_FILE)
-                logging.info(f"Extracted {DB_FILE}")
-            else:
-                raise FileNotFoundError("Could not find .db file in downloaded zip.")
-        zip_path.unlink() 
-        logging.info("Chinook database setup complete.")
+    # The zip is small, so keep it in memory and extract straight to DB_FILE
+    zip_buffer = io.BytesIO()
+    with urllib.request.urlopen(DB_URL, timeout=DOWNLOAD_TIMEOUT) as response:
+        shutil.copyfileobj(response, zip_buffer, DOWNLOAD_CHUNK_SIZE)
+
+    logging.info("Download complete. Extracting the database...")
+    with zipfile.ZipFile(zip_buffer) as zip_ref:
+        # Find the .db file in the zip archive (it may be in a subdirectory)
+        db_file_name = next((member for member in zip_ref.namelist() if member.endswith(".db")), None)
+        if db_file_name is None:
+            raise FileNotFoundError("Could not find .db file in downloaded zip.")
+        # Write to a temporary name first so a failed extraction never leaves
+        # a partial database behind that would skip the download next time
+        partial_path = DB_FILE.with_name(DB_FILE.name + ".part")
+        with zip_ref.open(db_file_name) as src, open(partial_path, "wb") as dst:
+            shutil.copyfileobj(src, dst, DOWNLOAD_CHUNK_SIZE)
+        partial_path.replace(DB_FILE)
+    logging.info(f"Extracted {DB_FILE}")
+    logging.info("Chinook database setup complete.")
+
+def warm_db_file():
+    """
+    Read the whole database file once so its pages are in the OS page cache
+    (and so behind the mmap of every pooled connection) before the first
+    query. The Chinook database is about 1 MB, so this is near-instant.
+    """
+    with DB_FILE.open("rb") as f:
+        while f.read(1 << 20):
+            pass
 
 # --- Local SQL Identifier Escaping Function ---
 def escape_sql_identifier_local(identifier: str) -> str:
@@ -87,39 +165,84 @@ def escape_sql_identifier_local(identifier: str) -> str:
     """
     if not isinstance(identifier, str):
         raise TypeError("Identifier must be a string")
+    if '"' not in identifier:
+        # Fast path: nothing to escape, so skip the allocating replace()
+        return f'"{identifier}"'
     escaped_identifier = identifier.replace('"', '""')
     return f'"{escaped_identifier}"'
 
 # --- MCP Server Initialization ---
+@asynccontextmanager
+async def _database_served() -> AsyncIterator[None]:
+    """
+    Prepares the database before the server starts serving and closes the
+    connection pool once it stops. aiosqlite runs each connection on a
+    non-daemon thread, so the process cannot exit while the pool is open.
+    """
+    try:
+        await asyncio.to_thread(download_chinook_db)
+        await asyncio.to_thread(warm_db_file)
+        # Open the first pooled connection and read sqlite_master now, so the
+        # first tool call does not pay for connection setup or cold pages
+        await _load_schema_cache()
+        yield
+    finally:
+        # On Ctrl+C uvicorn re-raises SIGINT after it stops, and asyncio.run()
+        # then cancels this task; finish closing the pool before giving up
+        close_pool = asyncio.ensure_future(pool.close())
+        try:
+            await asyncio.shield(close_pool)
+        except asyncio.CancelledError:
+            await close_pool
+            raise
+
+class ChinookMCP(FastMCP):
+    """
+    FastMCP server whose transport runners set up the database first and
+    close the connection pool on shutdown. FastMCP.run() and the mcp CLI
+    (`mcp run`, `mcp dev`) call these too, so every host shuts down cleanly.
+    """
+
+    async def run_stdio_async(self) -> None:
+        async with _database_served():
+            await super().run_stdio_async()
+
+    async def run_sse_async(self, mount_path: str | None = None) -> None:
+        async with _database_served():
+            await super().run_sse_async(mount_path)
+
+    async def run_streamable_http_async(self) -> None:
+        async with _database_served():
+            await super().run_streamable_http_async()
+
 # Create the MCP server instance with metadata and dependencies
-mcp_server = FastMCP(
+mcp_server = ChinookMCP(
     "ChinookDBExplorer",
     description="MCP Server for exploring the Chinook SQLite database.",
-    dependencies=["sqlite3", "httpx"]
+    dependencies=["sqlite3", "aiosqlite", "aiosqlitepool"],
 )
+# Name the mcp CLI looks for, so `mcp run chinook_mcp_server.py` finds it
+server = mcp_server
 
-def _get_table_names(conn: sqlite3.Connection) -> list[str]:
-    """
-    Returns a list of user table names in the database (excluding SQLite internal tables).
-    """
-    cursor = conn.cursor()
-    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%';")
-    return [row["name"] for row in cursor.fetchall()]
+# --- Schema Cache ---
+# The schema never changes at runtime, so every table's columns are read
+# from SQLite in one query and the formatted schemas served from memory.
+_TABLE_SCHEMAS: dict[str, str] = {} # Keyed by table name, in sqlite_master order
+_FULL_SCHEMA: str | None = None
+
+# Columns of every user table (excluding SQLite internal tables) in one pass
+_SCHEMA_QUERY = """
+    SELECT m.name AS table_name, p.name, p.type, p."notnull", p.dflt_value, p.pk
+    FROM sqlite_master AS m
+    JOIN pragma_table_info(m.name) AS p
+    WHERE m.type = 'table' AND m.name NOT LIKE 'sqlite_%'
+    ORDER BY m.rowid, p.cid;
+"""
 
-def _get_table_schema(conn: sqlite3.Connection, table_name: str) -> str:
+def _format_table_schema(table_name: str, columns: list[sqlite3.Row]) -> str:
     """
     Returns a formatted string describing the schema of a specific table.
     """
-    cursor = conn.cursor()
-    try:
-        if table_name not in _get_table_names(conn):
-            return f"Table '{table_name}' not found."
-        cursor.execute(f"PRAGMA table_info('{table_name}');")
-    except sqlite3.Error as e:
-        return f"Error fetching schema for table '{table_name}': {e}"
-    columns = cursor.fetchall()
-    if not columns:
-        return f"Table '{table_name}' not found or has no columns."
     schema_str = f"Schema for table {table_name}:\n"
     for col in columns:
         schema_str += f"  - {col['name']} ({col['type']})"
@@ -132,6 +255,27 @@ def _get_table_schema(conn: sqlite3.Connection, table_name: str) -> str:
         schema_str += "\n"
     return schema_str
 
+async def _load_schema_cache() -> str:
+    """
+    Builds (once) the per-table schema cache and returns the concatenated
+    schema of all tables.
+    """
+    global _FULL_SCHEMA
+    if _FULL_SCHEMA is None:
+        async with pool.connection() as conn:
+            cursor = await conn.execute(_SCHEMA_QUERY)
+            rows = await cursor.fetchall()
+        columns_by_table: dict[str, list[sqlite3.Row]] = {}
+        for row in rows:
+            columns_by_table.setdefault(row["table_name"], []).append(row)
+        for table_name, columns in columns_by_table.items():
+            _TABLE_SCHEMAS[table_name] = _format_table_schema(table_name, columns)
+        full_schema = "Database Schema:\n\n"
+        for table_schema in _TABLE_SCHEMAS.values():
+            full_schema += table_schema + "\n---\n\n"
+        _FULL_SCHEMA = full_schema.strip()
+    return _FULL_SCHEMA
+
 # --- Resources ---
 @mcp_server.resource("resource://chinook/tables")
 async def list_tables_schema() -> str:
@@ -139,12 +283,7 @@ async def list_tables_schema() -> str:
     Provides the schema for all tables in the Chinook database.
     Returns a formatted string with the schema of each table.
     """
-    with get_db_connection() as conn:
-        table_names = _get_table_names(conn)
-        full_schema = "Database Schema:\n\n"
-        for table_name in table_names:
-            full_schema += _get_table_schema(conn, table_name) + "\n---\n\n"
-        return full_schema.strip()
+    return await _load_schema_cache()
 
 @mcp_server.resource("resource://chinook/table/{table_name}")
 async def get_specific_table_schema(table_name: str) -> str:
@@ -153,59 +292,119 @@ async def get_specific_table_schema(table_name: str) -> str:
     Example usage: schema://chinook/table/Artist
     Returns a formatted string describing the table's schema.
     """
-    with get_db_connection() as conn:
-        table_schema = _get_table_schema(conn, table_name)
-        return table_schema.strip()
+    await _load_schema_cache()
+    table_schema = _TABLE_SCHEMAS.get(table_name)
+    if table_schema is None:
+        return f"Table '{table_name}' not found."
+    return table_schema.strip()
 
 # --- Tools ---
 @mcp_server.tool()
-async def run_sql_query(sql_query: str) -> str:
+async def run_sql_query(sql_query: str, ctx: Context) -> str:
     """
     Executes a read-only (SELECT) SQL query against the Chinook database.
-    Only SELECT statements are allowed for safety.
+    Only read-only statements are allowed for safety; this is enforced by the
+    SQLite authorizer on each pooled connection.
+    Rows are fetched in batches, and a progress notification is sent after
+    each batch so clients can follow (or cancel) long-running queries.
     Args:
         sql_query: The SQL SELECT query to execute.
+        ctx: The MCP request context, used to report progress.
     Returns:
-        Query results as a formatted string, or an error message.
+        Query results as CSV (header row first, text quoted, NULL as an
+        empty field), or an error message.
     """
-    if not sql_query.strip().upper().startswith("SELECT"):
-        return "Error: Only SELECT queries are allowed."
     try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute(sql_query)
-            rows = cursor.fetchall()
+        async with pool.connection() as conn:
+            cursor = await conn.execute(sql_query)
+            cursor.row_factory = None # Plain tuples are all csv.writer needs
+            cursor.arraysize = QUERY_FETCH_SIZE
+            rows = await cursor.fetchmany()
             if not rows:
                 return "Query executed successfully, but returned no results."
-            column_names = [description[0] for description in cursor.description]
-            result_str = "Query Results:\n"
-            result_str += ", ".join(column_names) + "\n"
-            result_str += "-" * (len(", ".join(column_names))) + "\n"
-            for row in rows:
-                result_str += ", ".join(map(str, row)) + "\n"
-            return result_str
+            result = io.StringIO()
+            # Quote every text value so an empty string ("") stays distinct
+            # from NULL, which is written as an empty field
+            writer = csv.writer(result, lineterminator="\n", quoting=csv.QUOTE_STRINGS)
+            writer.writerow(description[0] for description in cursor.description)
+            # A record of one empty field must be quoted, so a lone NULL cannot
+            # be told apart from "" (and raises on Python 3.13); write it as ""
+            single_column = len(cursor.description) == 1
+            row_count = 0
+            while rows:
+                if single_column:
+                    rows = [("" if value is None else value,) for (value,) in rows]
+                writer.writerows(rows)
+                row_count += len(rows)
+                await ctx.report_progress(row_count, message=f"Fetched {row_count} rows")
+                rows = await cursor.fetchmany()
+            return result.getvalue()
     except sqlite3.Error as e:
+        # Errors raised by the sqlite3 module itself (e.g. stacked statements)
+        # carry no SQLite error code, so sqlite_errorname may be missing.
+        # A denied pragma table-valued function (e.g. pragma_index_list) is
+        # reported as SQLITE_ERROR, so match the authorizer's message as well.
+        if getattr(e, "sqlite_errorname", None) == "SQLITE_AUTH" or str(e) == "not authorized":
+            return "Error: Only SELECT queries are allowed."
         return f"SQL Error: {e}"
     except Exception as e:
         return f"An unexpected error occurred: {e}"
 
 # --- Prompts ---
+# Prompt bodies depend only on their arguments, so the constant prompt is
+# built once at import and the parameterised ones are memoized per argument.
+_LIST_ALL_TABLES_MSGS: list[mcp_prompts.Message] = [
+    mcp_prompts.UserMessage(
+        "How can I see all the tables and their schemas in the Chinook database?"
+    ),
+    mcp_prompts.AssistantMessage(
+        "You can inspect the `resource://chinook/tables` resource. "
+        "It contains the schema for all tables. "
+        "Alternatively, you can ask me to query specific information using SQL."
+    )
+]
+
+@functools.lru_cache(maxsize=128)
+def _show_table_schema_prompt(table_name: str) -> str:
+    """
+    Memoized body of the show_table_schema prompt.
+    """
+    return (
+        f"Please show me the schema for the '{table_name}' table. "
+        f"You can use the `resource://chinook/table/{table_name}` resource."
+    )
+
+@functools.lru_cache(maxsize=128)
+def _count_table_rows_prompt(table_name: str) -> str:
+    """
+    Memoized body of the count_table_rows prompt.
+    """
+    safe_table_name_for_prompt = escape_sql_identifier_local(table_name)
+    return (
+        f"How many rows are in the '{table_name}' table? "
+        f"You can use the `run_sql_query` tool with a query like: "
+        f"'SELECT COUNT(*) FROM {safe_table_name_for_prompt};'"
+    )
+
+@functools.lru_cache(maxsize=128)
+def _query_top_artists_prompt(limit: int) -> str:
+    """
+    Memoized body of the query_top_artists prompt.
+    """
+    return (
+        f"Can you show me the top {limit} artists with the most tracks? "
+        "You'll likely need to join the 'Artist' and 'Album' tables, then 'Track' table, "
+        "group by artist, count tracks, and order by the count descending, limiting to "
+        f"{limit} results using the `run_sql_query` tool."
+    )
+
 @mcp_server.prompt()
 async def list_all_tables() -> list[mcp_prompts.Message]:
     """
     Generate a prompt to list all tables in the database using the schema resource.
     Returns a list of MCP prompt messages for LLMs.
     """
-    return [
-        mcp_prompts.UserMessage(
-            "How can I see all the tables and their schemas in the Chinook database?"
-        ),
-        mcp_prompts.AssistantMessage(
-            "You can inspect the `resource://chinook/tables` resource. "
-            "It contains the schema for all tables. "
-            "Alternatively, you can ask me to query specific information using SQL."
-        )
-    ]
+    return _LIST_ALL_TABLES_MSGS
 
 @mcp_server.prompt()
 async def show_table_schema(table_name: str) -> str:
@@ -216,10 +415,7 @@ async def show_table_schema(table_name: str) -> str:
     Returns:
         A string prompt for the LLM.
     """
-    return (
-        f"Please show me the schema for the '{table_name}' table. "
-        f"You can use the `resource://chinook/table/{table_name}` resource."
-    )
+    return _show_table_schema_prompt(table_name)
 
 @mcp_server.prompt()
 async def count_table_rows(table_name: str) -> str:
@@ -230,12 +426,7 @@ async def count_table_rows(table_name: str) -> str:
     Returns:
         A string prompt for the LLM.
     """
-    safe_table_name_for_prompt = escape_sql_identifier_local(table_name)
-    return (
-        f"How many rows are in the '{table_name}' table? "
-        f"You can use the `run_sql_query` tool with a query like: "
-        f"'SELECT COUNT(*) FROM {safe_table_name_for_prompt};'"
-    )
+    return _count_table_rows_prompt(table_name)
 
 @mcp_server.prompt()
 async def query_top_artists(limit: int = 5) -> str:
@@ -248,20 +439,25 @@ async def query_top_artists(limit: int = 5) -> str:
     """
     if not isinstance(limit, int) or limit < 1:
         return "Error: limit must be a positive integer."
-    return (
-        f"Can you show me the top {limit} artists with the most tracks? "
-        "You'll likely need to join the 'Artist' and 'Album' tables, then 'Track' table, "
-        "group by artist, count tracks, and order by the count descending, limiting to "
-        f"{limit} results using the `run_sql_query` tool."
-    )
+    return _query_top_artists_prompt(limit)
 
 # --- Main Execution ---
 if __name__ == "__main__":
-    # Download the Chinook database if needed before starting the MCP server
-    async def pre_run_setup():
-        await download_chinook_db()
-
-    asyncio.run(pre_run_setup())
-    
-    # Start the MCP server using stdio transport
-    mcp_server.run(transport="stdio")
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="MCP server for the Chinook SQLite database.")
+    parser.add_argument(
+        "--transport", choices=["streamable-http", "stdio"], default="streamable-http",
+        help="MCP transport to serve (default: streamable-http)",
+    )
+    parser.add_argument("--host", default="127.0.0.1", help="Host to bind for streamable-http (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8000, help="Port to bind for streamable-http (default: 8000)")
+    args = parser.parse_args()
+
+    # Start the MCP server; streamable HTTP serves at http://<host>:<port>/mcp.
+    # The database is downloaded if needed before it starts serving.
+    mcp_server.settings.host = args.host
+    mcp_server.settings.port = args.port
+    if args.transport == "stdio":
+        run_server = mcp_server.run_stdio_async
+    else:
+        run_server = mcp_server.run_streamable_http_async
+    asyncio.run(run_server(), loop_factory=_LOOP_FACTORY)